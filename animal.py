@@ -4,14 +4,18 @@ in various editions of David H. Ahl's _BASIC Computer Games_ books back in the
 1970s.
 """
 
+import json
+import os
 import sys
+import tempfile
 
 # The original program used a BASIC DATA statement to populate an array of
 # strings that serve as tree nodes, and refer to each other by array indices.
 # This Python version implements the same initial tree nodes using
 # dictionaries. There are two kinds of nodes: question nodes, which always
 # appear in the tree with two leaf nodes, and guess nodes, which are the
-# leaves.
+# leaves. A question node always has a 'Q' key and a guess node never does, so
+# we tell them apart with a simple membership test.
 #
 # Following a path through question nodes, the program asks a series of
 # questions to narrow down the options, until it reaches a guess node, and
@@ -26,8 +30,22 @@ import sys
 # "Does it swim?" is always the first question. I have kept that behavior, but
 # support for re-balancing the tree would be an interesting future upgrade to
 # the program.
-g_node_fish = {"A":"a fish"}
-g_node_bird = {"A":"a bird"}
+#
+# Unlike the original program, which forgot everything it had learned when it
+# stopped running, we save the tree to a file when the user says goodbye, and
+# load it again the next time the program starts, so the game keeps getting
+# smarter from one session to the next. The tree below is only used the first
+# time the program runs, before it has a saved tree.
+#
+# A guess node also carries the question we ask when we reach it, under the 'P'
+# key, so we build that string once when the node is created, instead of every
+# time the guess is made.
+def build_g_node(a_str:str) -> dict:
+    return {'A':a_str,
+            'P':'Is it ' + a_str + '?'}
+
+g_node_fish = build_g_node("a fish")
+g_node_bird = build_g_node("a bird")
 q_node_root = {"Q":"Does it swim?",
                "Y":g_node_fish,
                "N":g_node_bird}
@@ -48,36 +66,56 @@ q_node_root = {"Q":"Does it swim?",
 #   a capital letter and ends with a question mark, so if the user typed "does
 #   it have four wings and fly," the question will be stored as "Does it have
 #   four wings and fly?"
+# - We intern the animal names and questions we store in the tree, so that if
+#   the user types the same question for more than one part of the tree, as
+#   often happens with questions like "Does it have fur?", all of those
+#   question nodes share a single copy of the string.
+#
+# All input goes through the same readline method of standard input, so we
+# look it up once here rather than on every line the user types.
+readline = sys.stdin.readline
+
 def get_one_word_answer() -> str:
-    return sys.stdin.readline().strip().lower()
+    return readline().strip().lower()
+
+# Only the first letter of a one-word answer matters, so everywhere we check
+# one, we compare its first character, sliced with [:1], against a letter.
+# Slicing rather than indexing [0] means an empty answer (the user just pressed
+# Enter) gives us an empty string rather than an IndexError.
+#
+# The kinds of answer we accept to "Are you thinking of an animal?" Anything
+# else ends the program.
+ANSWER_OTHER = 0
+ANSWER_YES = 1
+ANSWER_TREE = 2
 
-def is_answer_affirmative(answer_str:str) -> bool:
-    return answer_str[0] == 'y'
+answer_kinds = {'y':ANSWER_YES,
+                't':ANSWER_TREE}
 
-def is_answer_tree(answer_str:str) -> bool:
-    return answer_str[0] == 't'
+def classify_answer(answer_str:str) -> int:
+    return answer_kinds.get(answer_str[:1], ANSWER_OTHER)
 
 def get_answer() -> str:
-    return sys.stdin.readline().strip()
+    return readline().strip()
 
 def get_animal() -> str:
-    return get_answer().lower()
+    return sys.intern(get_answer().lower())
 
 def get_question() -> str:
     q_str = get_answer().lower().capitalize()
     if q_str[-1] != '?':
-        return q_str + '?'
+        return sys.intern(q_str + '?')
     else:
-        return q_str
+        return sys.intern(q_str)
 
 def get_q_answer(new_a_str:str) -> bool:
     print('For ' + new_a_str + ', what is the answer?')
-    return is_answer_affirmative(get_one_word_answer())
+    return get_one_word_answer()[:1] == 'y'
 
 # Make a new guess node with a new animal name.
 def make_g_node() -> dict:
     print('What animal were you thinking of? ')
-    return {'A':get_animal()}
+    return build_g_node(get_animal())
 
 # Make a new incomplete question node, with a new question to distinguish
 # between the correct animal and the animal we incorrectly guessed.
@@ -132,8 +170,8 @@ def insert_new_no_branch_q_node(q_node:dict, g_node:dict):
 # and a question we can use in the future to distinguish between the two
 # animals. This is how the game "learns."
 def play_g_node(q_node:dict, g_node:dict, followed_yes_path:bool) -> None:
-    print("Is it " + g_node['A'] + '?')
-    if is_answer_affirmative(get_one_word_answer()):
+    print(g_node['P'])
+    if get_one_word_answer()[:1] == 'y':
         print('Great! Try another animal!')
     else:
         # Add a new question node to the existing question node's "yes" or "no"
@@ -143,32 +181,43 @@ def play_g_node(q_node:dict, g_node:dict, followed_yes_path:bool) -> None:
         else:
             insert_new_no_branch_q_node(q_node, g_node)
 
-# This function handles any pair of parent and child nodes once we've asked at
-# least one question, and so know if we're following the "yes" branch or not.
-# Gameplay proceeds with mutual recursion between the pair of functions
-# play_q_node() and play_node() until a guess node is reached.
-def play_node(q_node:dict, node:dict, followed_yes_path:bool) -> None:
-    if (node.get('Q')):
-        play_q_node(node)
-    else:
-        play_g_node(q_node, node, followed_yes_path)
-
-# This function handles any question node including the root. Ask the question,
-# and then we know whether we're following the "yes" branch or not, and can
-# call play_node().
-def play_q_node(q_node) -> None:
-    print(q_node['Q'])
-    if is_answer_affirmative(get_one_word_answer()):
-        play_node(q_node, q_node["Y"], True)
-    else:
-        play_node(q_node, q_node["N"], False)
+# This function handles the whole game, starting from the root question node.
+# Ask the question at each question node, and follow the "yes" or "no" branch
+# depending on the answer, until we reach a guess node. We keep track of the
+# parent question node and which branch we followed, because if the guess is
+# incorrect, the new question node replaces the guess node in the parent. An
+# earlier version of this program used mutual recursion to walk the tree; a
+# loop avoids a function call per question, and can't run into Python's
+# recursion limit, no matter how deep the tree grows.
+#
+# The functions called in the loop are bound to local names through default
+# arguments, because Python looks up local names faster than global names and
+# builtins. Callers should only ever pass the root node.
+def play_game(root_q_node:dict, _print=print,
+              _get_one_word_answer=get_one_word_answer) -> None:
+    # The root node is always a question node, so the loop body always runs
+    # at least once, and parent_q_node is always set when the loop exits.
+    node = root_q_node
+    parent_q_node = None
+    followed_yes_path = True
+    while 'Q' in node:
+        _print(node['Q'])
+        followed_yes_path = _get_one_word_answer()[:1] == 'y'
+        parent_q_node = node
+        if followed_yes_path:
+            node = node['Y']
+        else:
+            node = node['N']
+    play_g_node(parent_q_node, node, followed_yes_path)
 
-def play_game(root_q_node:dict) -> None:
-    # The root node is always a question node.
-    play_q_node(root_q_node)
+# Indent strings for printing the game tree, indexed by level. These are built
+# ahead of time, and the table grows if the tree ever gets deeper than that.
+indent_strs = ["   " * level for level in range(64)]
 
 def get_indent_str(level) -> str:
-    return " " * level * 3
+    while level >= len(indent_strs):
+        indent_strs.append("   " * len(indent_strs))
+    return indent_strs[level]
 
 # This is a pre-order, depth-first binary tree traversal in disguise. The basic
 # algorithm is expressed something like this (in pseudocode):
@@ -178,30 +227,166 @@ def get_indent_str(level) -> str:
 #     handle_node(node.left)
 #     handle_node(node.right) 
 #    
-# Our traversal to print the game tree differs in the following ways:
+# Our traversal to list the lines of the game tree differs in the following
+# ways:
 #
 # - We have two types of nodes, and they are handled differently, rather than
 #   the usual design in which all nodes are the same type, and leaf nodes have
 #   null left and right child pointers or references.
 #
-# - We report the current node question before each recursive call to handle
-#   the left and right subtrees (in our case, the "yes" and "no" subtrees),
-#   instead of just once before both calls. This is to make it clearer which
-#   combination of question and answer brings us to each question or guess
-#   node, because when printing a large tree there can be a large number of
-#   lines from the subtrees printed between the two branches of a question
-#   node.
+# - We report the current node question before handling each of the left and
+#   right subtrees (in our case, the "yes" and "no" subtrees), instead of just
+#   once before both. This is to make it clearer which combination of question
+#   and answer brings us to each question or guess node, because when printing
+#   a large tree there can be a large number of lines from the subtrees printed
+#   between the two branches of a question node.
 #
 # - We have a level parameter, used for indentation.
-def print_game_tree(node:dict, level:int):
-    if (node.get('Q')):
-        print(get_indent_str(level) + 'Question: ' + node['Q'] + ' -> yes:')
-        print_game_tree(node['Y'], level + 1)
-        print(get_indent_str(level) + 'Question: ' + node['Q'] + ' -> no:')
-        print_game_tree(node["N"], level + 1)
-    else:
-        print(get_indent_str(level) + "Guess: " + node['A'])
-    return
+#
+# - We don't actually recurse. Instead we keep our own stack of nodes still to
+#   visit, so that printing a very deep tree can't run into Python's recursion
+#   limit. Each entry on the stack holds a node, its level, and whether we have
+#   already handled the "yes" subtree of that node. When we visit a question
+#   node the first time, we push it back onto the stack to be visited again
+#   for the "no" branch, and then push its "yes" child on top, so that the
+#   whole "yes" subtree is printed before we come back to the "no" branch.
+#
+# As in play_game(), the functions and methods called in the loop are bound to
+# local names first, so they aren't looked up again for every node.
+def get_game_tree_lines(root_node:dict, level:int) -> list:
+    lines = []
+    stack = [(root_node, level, False)]
+    add_line = lines.append
+    push = stack.append
+    pop = stack.pop
+    _get_indent_str = get_indent_str
+    while stack:
+        node, level, yes_branch_done = pop()
+        if 'Q' in node:
+            indent_q_str = _get_indent_str(level) + 'Question: ' + node['Q']
+            if not yes_branch_done:
+                add_line(indent_q_str + ' -> yes:')
+                push((node, level, True))
+                push((node['Y'], level + 1, False))
+            else:
+                add_line(indent_q_str + ' -> no:')
+                push((node['N'], level + 1, False))
+        else:
+            add_line(_get_indent_str(level) + "Guess: " + node['A'])
+    return lines
+
+# A large tree can print hundreds of lines, so rather than calling print() for
+# each one, we collect them all and write them out in one go.
+def print_game_tree(root_node:dict, level:int):
+    sys.stdout.write('\n'.join(get_game_tree_lines(root_node, level)) + '\n')
+
+# The saved tree is kept in the current directory, as a JSON list of the tree's
+# nodes in pre-order: each question node is written as ["Q", question] and is
+# followed by all of its "yes" subtree and then all of its "no" subtree, and
+# each guess node is ["A", animal name]. Writing the nodes out as a flat list,
+# with our own stack like the tree printing code, rather than as nested
+# dictionaries, means saving or loading a very deep tree can't run into
+# Python's recursion limit either.
+tree_file_name = 'animal.json'
+
+def get_game_tree_items(root_q_node:dict) -> list:
+    items = []
+    stack = [root_q_node]
+    while stack:
+        node = stack.pop()
+        if 'Q' in node:
+            items.append(['Q', node['Q']])
+            stack.append(node['N'])
+            stack.append(node['Y'])
+        else:
+            items.append(['A', node['A']])
+    return items
+
+# Rebuild the tree from the list of nodes. We keep a stack of the question
+# node "yes" and "no" slots still waiting for a child; each node we read fills
+# the most recent slot, and a question node pushes its own two slots. We
+# rebuild each guess node with build_g_node(), so it gets its guess prompt
+# back, and intern the strings, just as if the user had typed them.
+def build_game_tree(items:list) -> dict:
+    root_q_node = None
+    slots = []
+    for kind, text in items:
+        if kind == 'Q':
+            node = {'Q':sys.intern(text),
+                    'Y':None,
+                    'N':None}
+        elif kind == 'A':
+            node = build_g_node(sys.intern(text))
+        else:
+            raise ValueError('unknown node kind ' + repr(kind))
+        if slots:
+            parent_q_node, key = slots.pop()
+            parent_q_node[key] = node
+        elif root_q_node is None and kind == 'Q':
+            root_q_node = node
+        else:
+            raise ValueError('misplaced node ' + repr(text))
+        if kind == 'Q':
+            slots.append((node, 'N'))
+            slots.append((node, 'Y'))
+    if root_q_node is None or slots:
+        raise ValueError('incomplete game tree')
+    return root_q_node
+
+# If the saved tree can't be read or doesn't hold a valid tree, we tell the
+# user and start over with the initial tree rather than refusing to run. A file
+# of deeply nested brackets makes json.load() itself run out of recursion, so
+# we catch RecursionError too. Rather than overwrite the bad file the next time
+# the tree is saved, we move it aside, so that it can still be looked at or
+# recovered by hand.
+bad_tree_file_name = tree_file_name + '.bad'
+
+def load_game_tree(default_root_q_node:dict) -> dict:
+    try:
+        with open(tree_file_name, encoding='utf-8') as tree_file:
+            return build_game_tree(json.load(tree_file))
+    except FileNotFoundError:
+        return default_root_q_node
+    except (OSError, ValueError, TypeError, RecursionError) as err:
+        err_str = 'Could not load the saved game tree from ' + tree_file_name \
+                  + ' (' + str(err) + ')'
+        try:
+            os.replace(tree_file_name, bad_tree_file_name)
+            print(err_str + ', so moved it to ' + bad_tree_file_name \
+                  + ' and starting over.')
+        except OSError:
+            print(err_str + ', so starting over.')
+        return default_root_q_node
+
+# We write the tree to a temporary file in the same directory first, and only
+# replace the saved tree with it once it has been written completely, so if
+# anything goes wrong partway through, the previously saved tree is kept. If
+# the tree can't be saved at all, for example because the current directory
+# isn't writable, we tell the user and carry on, rather than refusing to quit.
+def save_game_tree(root_q_node:dict) -> None:
+    tree_dir = os.path.dirname(os.path.abspath(tree_file_name))
+    temp_file_name = None
+    try:
+        try:
+            temp_fd, temp_file_name = tempfile.mkstemp(dir=tree_dir,
+                                                       suffix='.tmp')
+            with os.fdopen(temp_fd, 'w', encoding='utf-8') as temp_file:
+                json.dump(get_game_tree_items(root_q_node), temp_file)
+            # mkstemp() makes the file readable only by its owner, so give it
+            # the mode open() would have, following the user's umask.
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_file_name, 0o666 & ~umask)
+            os.replace(temp_file_name, tree_file_name)
+            temp_file_name = None
+        finally:
+            if temp_file_name is not None:
+                os.remove(temp_file_name)
+    except OSError as err:
+        print('Could not save the game tree to ' + tree_file_name \
+              + ' (' + str(err) + ').')
+
+q_node_root = load_game_tree(q_node_root)
 
 print()
 print('Play "Guess the Animal." Think of an animal and the computer will')
@@ -217,15 +402,16 @@ print('"Are you thinking of an animal?"')
 while True:
     print()
     print('Are you thinking of an animal?')
-    answer_str = get_one_word_answer()
-    if is_answer_affirmative(answer_str):
+    answer_kind = classify_answer(get_one_word_answer())
+    if answer_kind == ANSWER_YES:
         # Note that the root node is never replaced; the initial question is
         # always the same. Therefore, we don't need to pass a parent node to.
         # play_root().
         play_game(q_node_root)
-    elif is_answer_tree(answer_str):
+    elif answer_kind == ANSWER_TREE:
         print("Game tree:")
         print_game_tree(q_node_root, 1)
     else:
+        save_game_tree(q_node_root)
         print("Goodbye for now!")
-        break
\ No newline at end of file
+        break